@@ -0,0 +1,179 @@
+"""Vectorized tab analytics: auto difficulty, note counts and fret range.
+
+All tabs of a batch are packed into one uint8 buffer (tab-major, then string,
+then column) and analysed with NumPy in a single pass, so a catalogue-wide
+recompute does not loop over notes in Python. The same code runs for a
+single tab on create/edit.
+"""
+import re
+
+import numpy as np
+
+from db import db
+from models import Tab
+
+STRING_COUNT = 6
+MAX_FRET = 30
+# hammer-on, pull-off, bend, slides, vibrato, release, dead note
+TECHNIQUE_CHARS = np.frombuffer(b'hpb/\\~rx', dtype=np.uint8)
+_BAR = ord('|')
+# lower bound for the time axis (tabs often have no bar lines): a 4/4 measure of eighth notes written
+# as '0-0-0-0-0-0-0-0-' is 16 columns wide
+COLUMNS_PER_MEASURE = 16
+
+# leading string name: 'e |', 'E|', 'D: |', 'F# |'
+_STRING_NAME = re.compile(r'^[A-Ga-g][#b]?\s*:?\s*')
+
+
+def split_strings(content):
+    """Six string lines of a tab with the string name removed (missing lines are '')."""
+    lines = [line.strip() for line in (content or '').replace('\r\n', '\n').split('\n')]
+    lines = [_STRING_NAME.sub('', line, count=1) for line in lines if line][:STRING_COUNT]
+    return lines + [''] * (STRING_COUNT - len(lines))
+
+
+def _group_reduce(ufunc, values, groups, n, empty):
+    """ufunc.reduceat over runs of equal (sorted) group ids -> array of length n."""
+    out = np.full(n, empty, dtype=np.int64)
+    if len(values) == 0:
+        return out
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    out[groups[starts]] = ufunc.reduceat(values, starts)
+    return out
+
+
+def analyze_contents(contents, bpms):
+    """Analyse a batch of tab contents. Returns a dict of int arrays (one entry per tab):
+    difficulty, note_count, fret_min, fret_max, max_span, shifts, techniques."""
+    n = len(contents)
+    bpm = np.array([b or 120 for b in bpms], dtype=np.float64)
+
+    # pack every line into one buffer; pad lines of a tab to equal width so columns align
+    chunks, widths = [], np.zeros(n, dtype=np.int64)
+    for t, content in enumerate(contents):
+        lines = [line.encode('ascii', 'replace') for line in split_strings(content)]
+        width = max(len(line) for line in lines) + 1  # +1: separator so runs never cross lines
+        widths[t] = width
+        chunks.extend(line.ljust(width, b'-') for line in lines)
+    buf = np.frombuffer(b''.join(chunks), dtype=np.uint8) if chunks else np.zeros(0, dtype=np.uint8)
+
+    line_width = np.repeat(widths, STRING_COUNT)
+    line_start = np.concatenate(([0], np.cumsum(line_width)[:-1])) if n else np.zeros(0, dtype=np.int64)
+    line_tab = np.repeat(np.arange(n), STRING_COUNT)
+
+    def locate(positions):
+        line = np.searchsorted(line_start, positions, side='right') - 1
+        return line_tab[line], positions - line_start[line]
+
+    # ---- notes: runs of digits (up to two digits -> fret number) ----
+    is_digit = (buf >= 48) & (buf <= 57)
+    prev_digit = np.r_[False, is_digit[:-1]]
+    next_digit = np.r_[is_digit[1:], False]
+    starts = np.flatnonzero(is_digit & ~prev_digit)
+    frets = buf[starts].astype(np.int64) - 48
+    two = next_digit[starts]
+    second = buf[np.minimum(starts + 1, len(buf) - 1)].astype(np.int64) - 48 if len(buf) else frets
+    frets = np.where(two, frets * 10 + second, frets)
+    valid = frets <= MAX_FRET
+    starts, frets = starts[valid], frets[valid]
+    note_tab, note_col = locate(starts)
+
+    note_count = np.bincount(note_tab, minlength=n)
+    fret_min = _group_reduce(np.minimum, frets, note_tab, n, 0)
+    fret_max = _group_reduce(np.maximum, frets, note_tab, n, 0)
+
+    # ---- events: notes sharing a column in a tab (single notes or chords) ----
+    key = note_tab * (int(widths.max()) + 1 if n else 1) + note_col
+    order = np.argsort(key, kind='stable')
+    sk, sf, st = key[order], frets[order], note_tab[order]
+    if len(sk):
+        ev_start = np.flatnonzero(np.r_[True, sk[1:] != sk[:-1]])
+        ev_tab = st[ev_start]
+        ev_lo = np.minimum.reduceat(np.where(sf > 0, sf, MAX_FRET + 1), ev_start)
+        ev_hi = np.maximum.reduceat(np.where(sf > 0, sf, 0), ev_start)
+    else:
+        ev_tab = ev_lo = ev_hi = np.zeros(0, dtype=np.int64)
+    fretted = ev_hi > 0
+    ev_span = np.where(fretted, ev_hi - ev_lo, 0)
+    event_count = np.bincount(ev_tab, minlength=n)
+    max_span = _group_reduce(np.maximum, ev_span, ev_tab, n, 0)
+
+    # position shifts: hand moves 3+ frets between consecutive fretted events
+    pos, pos_tab = ev_lo[fretted], ev_tab[fretted]
+    jump = (np.abs(np.diff(pos)) >= 3) & (pos_tab[1:] == pos_tab[:-1])
+    shifts = np.bincount(pos_tab[1:][jump], minlength=n)
+    fretted_count = np.bincount(pos_tab, minlength=n)
+
+    # ---- techniques and measures ----
+    tech_tab, _ = locate(np.flatnonzero(np.isin(buf, TECHNIQUE_CHARS)))
+    techniques = np.bincount(tech_tab, minlength=n)
+    # measures: from the line with the most bar lines (often only some strings have
+    # them), but never fewer than the width in columns implies - tabs typed into
+    # /create usually have no bars or just one at each end
+    bar_pos = np.flatnonzero(buf == _BAR)
+    bar_line = np.searchsorted(line_start, bar_pos, side='right') - 1
+    bars_per_line = np.bincount(bar_line, minlength=n * STRING_COUNT).reshape(n, STRING_COUNT)
+    bars = bars_per_line.max(axis=1) if n else np.zeros(0, dtype=np.int64)
+    by_width = (widths - 1) / COLUMNS_PER_MEASURE
+    measures = np.maximum(np.maximum(bars - 1, by_width), 1)
+
+    # ---- difficulty 1..5 from weighted, clipped features ----
+    notes_per_sec = event_count / measures / 4 * bpm / 60  # assuming 4/4
+    score = (
+        0.25 * np.clip(max_span / 5.0, 0, 1)
+        + 0.20 * np.clip(shifts / np.maximum(fretted_count - 1, 1) / 0.4, 0, 1)
+        + 0.30 * np.clip((notes_per_sec - 2) / 8.0, 0, 1)
+        + 0.10 * np.clip(techniques / np.maximum(note_count, 1) / 0.25, 0, 1)
+        + 0.15 * np.clip(fret_max / 15.0, 0, 1)
+    )
+    difficulty = np.clip(1 + np.rint(score * 4), 1, 5).astype(np.int64)
+    difficulty[note_count == 0] = 1
+
+    return {
+        'difficulty': difficulty,
+        'note_count': note_count,
+        'fret_min': fret_min,
+        'fret_max': fret_max,
+        'max_span': max_span,
+        'shifts': shifts,
+        'techniques': techniques,
+    }
+
+
+def analyze_tab(tab):
+    """Fill difficulty / note_count / fret range of a single tab (caller commits)."""
+    stats = analyze_contents([tab.content], [tab.speed_bpm])
+    tab.difficulty = int(stats['difficulty'][0])
+    tab.note_count = int(stats['note_count'][0])
+    tab.fret_min = int(stats['fret_min'][0])
+    tab.fret_max = int(stats['fret_max'][0])
+    return stats
+
+
+def recompute_catalogue(chunk_size=5000):
+    """Recompute stats for every tab in chunks; only changed rows are written.
+    Returns (tabs analysed, tabs updated)."""
+    fields = ('difficulty', 'note_count', 'fret_min', 'fret_max')
+    total = updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Tab.id, Tab.content, Tab.speed_bpm, Tab.difficulty, Tab.note_count, Tab.fret_min, Tab.fret_max
+        ).filter(Tab.id > last_id).order_by(Tab.id).limit(chunk_size).all()
+        if not rows:
+            break
+        stats = analyze_contents([r.content for r in rows], [r.speed_bpm for r in rows])
+        new = np.column_stack([stats[f] for f in fields])
+        old = np.array([[-1 if v is None else v for v in r[3:]] for r in rows], dtype=np.int64)
+        changed = np.flatnonzero((new != old).any(axis=1))
+        changes = [
+            dict(zip(('id',) + fields, (rows[i].id,) + tuple(int(v) for v in new[i])))
+            for i in changed
+        ]
+        if changes:
+            db.session.execute(db.update(Tab), changes)
+            db.session.commit()
+        total += len(rows)
+        updated += len(changes)
+        last_id = rows[-1].id
+    return total, updated
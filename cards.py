@@ -0,0 +1,184 @@
+"""Cached song-card fragments for the list pages.
+
+The shared part of a card (title, owner, difficulty stars, length badge,
+open link) is rendered once per (variant, tab.id, tab.updated_at, owner
+version) and kept in a per-process LRU. Per-user bits - the favorite star and
+the owner's edit/delete buttons - are marked in the templates with
+<!--card:slot--> comments and filled in with plain string formatting on every
+request, so a list page is assembled from cached strings instead of running
+the card template N times.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from flask import current_app, url_for
+from markupsafe import Markup
+
+from db import db
+from models import Tab
+
+DEFAULT_CACHE_SIZE = 5000
+
+TEMPLATES = {
+    'grid': '_song_card.html',
+    'compact': '_song_card_compact.html',
+    'trending': '_song_card_trending.html',
+}
+# variants whose shared part shows the song length (needs Tab.content on a miss)
+SHOWS_LENGTH = {'grid', 'compact'}
+
+_SLOT = re.compile(r'<!--card:([\w-]+)-->')
+
+
+def get_song_length(content):
+    """Определяет длину песни по количеству строк"""
+    lines = len(content.strip().split('\n'))
+    if lines > 100:
+        return 'LONG', 'length-LONG'
+    elif lines > 50:
+        return 'MEDIUM', 'length-MEDIUM'
+    else:
+        return 'SHORT', 'length-SHORT'
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments; keys carry versions, so nothing is invalidated."""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+cache = FragmentCache()
+
+
+def card_key(tab, variant):
+    owner = tab.user
+    return (
+        variant,
+        tab.id,
+        tab.updated_at,
+        owner.id if owner else None,
+        owner.updated_at if owner else None,
+    )
+
+
+def _render_shared(tab, variant, length):
+    # render straight from the jinja env: no context processors, no per-user data
+    template = current_app.jinja_env.get_template(TEMPLATES[variant])
+    label, css_class = length
+    html = template.render(tab=tab, length_label=label, length_class=css_class)
+    # [literal, slot name, literal, slot name, ..., literal]
+    return tuple(_SLOT.split(html))
+
+
+def _star_slot(tab, fav_ids, current_user):
+    favorited = tab.id in fav_ids
+    return (
+        f'<form method="POST" action="{url_for("toggle_favorite", id=tab.id)}" style="display:inline;">'
+        f'<button type="submit" class="star-btn{" favorited" if favorited else ""}" '
+        f'title="{"Удалить из избранного" if favorited else "Добавить в избранное"}">'
+        f'<i class="fas fa-star"></i></button></form>'
+    )
+
+
+def _is_owner(tab, current_user):
+    return bool(current_user and tab.user_id and current_user.id == tab.user_id)
+
+
+def _owner_actions_slot(tab, fav_ids, current_user):
+    if not _is_owner(tab, current_user):
+        return ''
+    form_id = f'delete-form-{tab.id}'
+    return (
+        f'<a href="{url_for("edit_tab", id=tab.id)}" class="btn btn-edit"><i class="fas fa-edit"></i> Edit</a>'
+        f'<form id="{form_id}" action="{url_for("delete_tab", id=tab.id)}" method="POST" style="display: contents;">'
+        f'<button type="button" class="btn btn-delete" '
+        f'onclick="if(confirm(\'Удалить?\')) {{ document.getElementById(\'{form_id}\').submit(); }}" style="flex: 1;">'
+        f'<i class="fas fa-trash"></i> Delete</button></form>'
+    )
+
+
+def _owner_edit_slot(tab, fav_ids, current_user):
+    if not _is_owner(tab, current_user):
+        return ''
+    return f'<a class="btn btn-edit" href="{url_for("edit_tab", id=tab.id)}">Edit</a>'
+
+
+def _rank_slot(tab, fav_ids, current_user):
+    # set by the trending page, like favorites_count
+    return f'#{tab.trending_rank}'
+
+
+def _favorites_slot(tab, fav_ids, current_user):
+    return str(tab.favorites_count)
+
+
+SLOTS = {
+    'grid': {'star': _star_slot, 'owner-actions': _owner_actions_slot},
+    'compact': {'owner-actions': _owner_edit_slot},
+    'trending': {'rank': _rank_slot, 'star': _star_slot, 'favorites': _favorites_slot},
+}
+
+
+def _load_lengths(tabs):
+    """Song length for tabs about to be rendered. If content was deferred by the
+    list query, fetch it for just these tabs in one query."""
+    missing = [t.id for t in tabs if 'content' in db.inspect(t).unloaded]
+    contents = {}
+    if missing:
+        contents = dict(db.session.query(Tab.id, Tab.content).filter(Tab.id.in_(missing)).all())
+    return {
+        t.id: get_song_length(contents[t.id] if t.id in contents else t.content)
+        for t in tabs
+    }
+
+
+def render_cards(tabs, fav_ids=None, current_user=None, variant='grid'):
+    """HTML for a list of song cards, reusing cached fragments where possible.
+
+    List queries should eager-load Tab.user (the owner is part of the key) and
+    may defer Tab.content - it is only needed for cards that are not cached yet.
+    """
+    fav_ids = fav_ids or set()
+    slots = SLOTS[variant]
+    keyed = [(tab, card_key(tab, variant)) for tab in tabs]
+    parts = {key: cache.get(key) for _, key in keyed}
+
+    misses = [tab for tab, key in keyed if parts[key] is None]
+    if misses:
+        lengths = _load_lengths(misses) if variant in SHOWS_LENGTH else {}
+        for tab in misses:
+            key = card_key(tab, variant)
+            parts[key] = _render_shared(tab, variant, lengths.get(tab.id, (None, None)))
+            cache.set(key, parts[key])
+
+    out = []
+    for tab, key in keyed:
+        fragment = parts[key]
+        for i, piece in enumerate(fragment):
+            if i % 2:
+                out.append(slots[piece](tab, fav_ids, current_user))
+            else:
+                out.append(piece)
+    return Markup(''.join(out))
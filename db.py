@@ -1,3 +1,164 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, session as flask_session
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.sql.dml import UpdateBase
+
+# key in the Flask session cookie: reads go to the primary until this timestamp
+PRIMARY_PIN_KEY = '_db_primary_until'
+
+
+class ReplicaSet:
+    """Read replica engines with round-robin selection and background health checks.
+
+    A daemon thread per process pings every replica with SELECT 1 each
+    `health_interval` seconds, so requests never wait on a health check; a
+    failed ping or a disconnect error takes the replica out of rotation for
+    `health_interval` seconds. Connections use `connect_timeout` so an
+    unreachable replica fails fast instead of hanging a request.
+    """
+
+    def __init__(self, urls, health_interval=30, connect_timeout=2, engine_options=None):
+        options = dict(engine_options or {})
+        connect_args = dict(options.pop('connect_args', {}))
+        connect_args.setdefault('connect_timeout', connect_timeout)
+        self.engines = [
+            create_engine(url, pool_pre_ping=True, connect_args=connect_args, **options) for url in urls
+        ]
+        self.health_interval = health_interval
+        self._counter = itertools.count()
+        self._down_until = [0.0] * len(self.engines)
+        self._monitor_pid = None
+        self._monitor_lock = threading.Lock()
+        for i, engine in enumerate(self.engines):
+            event.listen(engine, 'handle_error', self._make_error_listener(i))
+
+    def _make_error_listener(self, index):
+        def on_error(context):
+            if context.is_disconnect:
+                self.mark_down(index)
+        return on_error
+
+    def mark_down(self, index):
+        self._down_until[index] = time.time() + self.health_interval
+
+    def _ping(self, index):
+        try:
+            with self.engines[index].connect() as conn:
+                conn.execute(text('SELECT 1'))
+            self._down_until[index] = 0.0
+            return True
+        except Exception:
+            self.mark_down(index)
+            return False
+
+    def _monitor(self):
+        while True:
+            for i in range(len(self.engines)):
+                self._ping(i)
+            time.sleep(self.health_interval)
+
+    def _ensure_monitor(self):
+        # one thread per process: worker processes forked after startup need their own
+        pid = os.getpid()
+        if self._monitor_pid == pid:
+            return
+        with self._monitor_lock:
+            if self._monitor_pid != pid:
+                threading.Thread(target=self._monitor, name='db-replica-health', daemon=True).start()
+                self._monitor_pid = pid
+
+    def is_healthy(self, index):
+        return self._down_until[index] <= time.time()
+
+    def choose(self):
+        """Next healthy replica engine, or None if all are down."""
+        self._ensure_monitor()
+        n = len(self.engines)
+        for _ in range(n):
+            i = next(self._counter) % n
+            if self.is_healthy(i):
+                return self.engines[i]
+        return None
+
+
+@contextmanager
+def primary_only():
+    """Route every read inside the block to the primary, even in a GET request context.
+
+    Background jobs that render templates inside app.test_request_context()
+    use this so their lazy loads do not go to a (possibly lagging) replica.
+    """
+    previous = g.get('db_force_primary', False)
+    g.db_force_primary = True
+    try:
+        yield
+    finally:
+        g.db_force_primary = previous
+
+
+def _reads_may_use_replica():
+    # CLI commands, background workers and non-GET requests always use the primary
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if g.get('db_wrote') or g.get('db_force_primary'):
+        return False
+    return flask_session.get(PRIMARY_PIN_KEY, 0) < time.time()
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Sends read-only statements of GET requests to a replica, everything else to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or primary is not self._db.engine:
+            return primary
+        if self._flushing or isinstance(clause, UpdateBase):
+            return primary
+        if clause is not None and getattr(clause, '_for_update_arg', None) is not None:
+            return primary
+        replicas = current_app.extensions.get('db_replicas')
+        if not replicas or not _reads_may_use_replica():
+            return primary
+        # one replica per request so all reads of a page see the same snapshot
+        if 'db_replica' not in g:
+            g.db_replica = replicas.choose()
+        return g.db_replica or primary
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def init_replicas(app):
+    """Create replica engines from SQLALCHEMY_REPLICA_URIS and pin writers to the primary.
+
+    After a request that wrote anything the client reads from the primary for
+    DB_READ_YOUR_WRITES_SECONDS, so it sees its own changes despite replica lag.
+    """
+    urls = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+    if urls:
+        app.extensions['db_replicas'] = ReplicaSet(
+            urls,
+            health_interval=app.config.get('DB_REPLICA_HEALTH_INTERVAL', 30),
+            connect_timeout=app.config.get('DB_REPLICA_CONNECT_TIMEOUT', 2),
+            engine_options=app.config.get('SQLALCHEMY_ENGINE_OPTIONS'),
+        )
+
+    @app.after_request
+    def _pin_primary_after_write(response):
+        if g.get('db_wrote'):
+            window = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+            flask_session[PRIMARY_PIN_KEY] = time.time() + window
+        return response
+
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,209 @@
+"""Near-duplicate tab detection: shingle-based MinHash signatures + LSH buckets.
+
+Each tab gets a MinHash signature computed at write time (stored in Tab.minhash)
+and one row per LSH band in tab_lsh_buckets. Two tabs whose content is similar
+are very likely to share at least one (band, bucket) pair, so candidate lookup
+is an indexed query instead of comparing against every row.
+"""
+import hashlib
+import random
+import re
+
+from db import db
+from models import Tab, TabLSHBucket
+
+# 64 permutations split into 16 bands of 4 rows: tabs with Jaccard ~0.6+
+# collide in at least one band with high probability, ~0.3 and below rarely do.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: signatures are persisted, so permutations must be stable across processes
+_rng = random.Random(20240526)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_DASH_RUN = re.compile(r'-{2,}')
+_SPACES = re.compile(r'[ \t]+')
+
+
+def _hash32(data):
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=4).digest(), 'big')
+
+
+def normalize_content(content):
+    """Lowercase, drop padding whitespace and collapse '----' filler so that
+    re-spaced copies of the same tab produce the same shingles."""
+    if not content:
+        return ''
+    lines = []
+    for line in content.replace('\r\n', '\n').split('\n'):
+        line = _SPACES.sub(' ', line.strip().lower())
+        line = _DASH_RUN.sub('-', line)
+        if line:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def shingles(content, k=SHINGLE_SIZE):
+    """Set of 32-bit hashes of character k-grams of the normalized content."""
+    text = normalize_content(content)
+    if not text:
+        return set()
+    if len(text) <= k:
+        return {_hash32(text)}
+    return {_hash32(text[i:i + k]) for i in range(len(text) - k + 1)}
+
+
+def minhash_signature(content):
+    """MinHash signature (list of NUM_PERM ints) for the given tab content."""
+    hashes = shingles(content)
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    sig = []
+    for a, b in _PERMUTATIONS:
+        sig.append(min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes))
+    return sig
+
+
+def encode_signature(sig):
+    return ' '.join('%08x' % v for v in sig)
+
+
+def decode_signature(raw):
+    if not raw:
+        return None
+    try:
+        sig = [int(v, 16) for v in raw.split()]
+    except ValueError:
+        return None
+    return sig if len(sig) == NUM_PERM else None
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity: share of matching MinHash slots."""
+    if not sig_a or not sig_b:
+        return 0.0
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / float(NUM_PERM)
+
+
+def lsh_buckets(sig):
+    """List of (band, bucket) pairs; bucket is a non-negative 63-bit int (fits BigInteger)."""
+    result = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(' '.join(map(str, chunk)).encode('ascii'), digest_size=8).digest()
+        result.append((band, int.from_bytes(digest, 'big') >> 1))
+    return result
+
+
+def index_tab(tab, sig=None):
+    """(Re)compute tab.minhash and its LSH bucket rows. Tab must already have an id
+    (call after db.session.flush()); the caller commits."""
+    if sig is None:
+        sig = minhash_signature(tab.content)
+    tab.minhash = encode_signature(sig)
+    TabLSHBucket.query.filter_by(tab_id=tab.id).delete(synchronize_session=False)
+    for band, bucket in lsh_buckets(sig):
+        db.session.add(TabLSHBucket(tab_id=tab.id, band=band, bucket=bucket))
+    return sig
+
+
+def find_near_duplicates(content, exclude_id=None, threshold=DEFAULT_THRESHOLD, limit=5, sig=None):
+    """Tabs whose estimated similarity to `content` is >= threshold.
+
+    Returns a list of (tab, similarity) sorted by similarity desc. Only tabs that
+    share an LSH bucket are loaded, so the cost does not grow with the catalogue.
+    """
+    if sig is None:
+        sig = minhash_signature(content)
+    conditions = [
+        db.and_(TabLSHBucket.band == band, TabLSHBucket.bucket == bucket)
+        for band, bucket in lsh_buckets(sig)
+    ]
+    q = db.session.query(TabLSHBucket.tab_id).filter(db.or_(*conditions))
+    if exclude_id is not None:
+        q = q.filter(TabLSHBucket.tab_id != exclude_id)
+    candidate_ids = {row[0] for row in q.distinct().all()}
+    if not candidate_ids:
+        return []
+
+    matches = []
+    for cand in Tab.visible().filter(Tab.id.in_(candidate_ids)).all():
+        score = estimate_similarity(sig, decode_signature(cand.minhash))
+        if score >= threshold:
+            matches.append((cand, score))
+    matches.sort(key=lambda m: m[1], reverse=True)
+    return matches[:limit]
+
+
+def cluster_duplicates(threshold=DEFAULT_THRESHOLD):
+    """Group the whole catalogue into clusters of near-duplicate tabs.
+
+    Streams bucket rows ordered by (band, bucket) and merges similar tabs with
+    union-find. Inside a bucket each member is only compared with one
+    representative per cluster found so far (identical signatures match via a
+    dict), so a huge bucket of boilerplate tabs costs O(m), not O(m^2).
+    Returns a list of lists of tab ids (only clusters with 2+ members), largest first.
+    """
+    signatures = {
+        tab_id: decode_signature(raw)
+        for tab_id, raw in db.session.query(Tab.id, Tab.minhash)
+        .filter(Tab.minhash.isnot(None), Tab.deleted_at.is_(None))
+    }
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(x, y):
+        rx, ry = find(x), find(y)
+        if rx != ry:
+            parent[max(rx, ry)] = min(rx, ry)
+
+    def flush(members):
+        exact = {}  # signature -> first member with it
+        reps = []   # one member per cluster seen in this bucket
+        for a in members:
+            sig_a = signatures.get(a)
+            if sig_a is None:
+                continue
+            same = exact.setdefault(tuple(sig_a), a)
+            if same != a:
+                union(same, a)
+                continue
+            for r in reps:
+                if find(r) == find(a) or estimate_similarity(signatures[r], sig_a) >= threshold:
+                    union(r, a)
+                    break
+            else:
+                reps.append(a)
+
+    rows = db.session.query(TabLSHBucket.band, TabLSHBucket.bucket, TabLSHBucket.tab_id) \
+        .order_by(TabLSHBucket.band, TabLSHBucket.bucket).yield_per(1000)
+    current_key, members = None, []
+    for band, bucket, tab_id in rows:
+        if (band, bucket) != current_key:
+            if len(members) > 1:
+                flush(members)
+            current_key, members = (band, bucket), []
+        members.append(tab_id)
+    if len(members) > 1:
+        flush(members)
+
+    clusters = {}
+    for tab_id in list(parent):
+        clusters.setdefault(find(tab_id), []).append(tab_id)
+    result = [sorted(ids) for ids in clusters.values() if len(ids) > 1]
+    result.sort(key=len, reverse=True)
+    return result
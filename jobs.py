@@ -0,0 +1,224 @@
+"""Durable background job queue stored in the main database (table `jobs`).
+
+Routes call enqueue() and return immediately; `flask --app app jobs-worker`
+runs one or more worker processes that claim jobs with SELECT ... FOR UPDATE
+SKIP LOCKED, execute the registered handler and retry failures with
+exponential backoff. Periodic tasks re-enqueue themselves after each run.
+"""
+import json
+import multiprocessing
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from db import db
+from models import Job
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 10
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_LEASE_SECONDS = 300
+
+# kind -> handler(**payload)
+_handlers = {}
+# kind -> interval in seconds, for tasks registered with every=
+_periodic = {}
+# job being executed by this thread (for heartbeat / report_progress); thread-local
+# because with JOBS_EAGER jobs run inside concurrent requests of the threaded server
+_local = threading.local()
+
+
+def _current():
+    return getattr(_local, 'job', None)
+
+
+def task(kind, every=None):
+    """Register a function as the handler for jobs of the given kind.
+    With every=<seconds> the job is re-enqueued that long after each run."""
+    def decorator(func):
+        _handlers[kind] = func
+        if every:
+            _periodic[kind] = every
+        return func
+    return decorator
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def enqueue(kind, payload=None, user_id=None, max_attempts=None, delay=0, commit=True):
+    """Create a queued job and return it. With JOBS_EAGER the job runs inline."""
+    if kind not in _handlers:
+        raise KeyError(f'Unknown job kind: {kind}')
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        user_id=user_id,
+        max_attempts=max_attempts or _config('JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    if _config('JOBS_EAGER', False) and not delay:
+        _claim(job)
+        run_job(job)
+    return job
+
+
+def pending(kind):
+    """Queued or running job of this kind, if any (used to avoid duplicate work)."""
+    return Job.query.filter(Job.kind == kind, Job.status.in_(('queued', 'running'))).first()
+
+
+def schedule_periodic():
+    """Make sure every periodic task has a queued or running job."""
+    for kind in _periodic:
+        if pending(kind) is None:
+            enqueue(kind)
+
+
+def _reschedule(job):
+    if job.kind in _periodic and Job.query.filter_by(kind=job.kind, status='queued').first() is None:
+        enqueue(job.kind, delay=_periodic[job.kind])
+
+
+def heartbeat():
+    """Extend the lease of the running job (caller commits).
+
+    Long handlers call this between batches so claim_next() does not treat the
+    job as abandoned after JOBS_LEASE_SECONDS and start it in a second worker.
+    """
+    job = _current()
+    if job is not None:
+        job.locked_at = datetime.utcnow()
+
+
+def report_progress(data):
+    """Store a JSON-serialisable progress snapshot on the running job, extend its lease and commit."""
+    job = _current()
+    if job is None:
+        return
+    job.progress = json.dumps(data)
+    heartbeat()
+    db.session.commit()
+
+
+def _claim(job):
+    job.status = 'running'
+    job.attempts = (job.attempts or 0) + 1
+    job.locked_at = datetime.utcnow()
+    db.session.commit()
+
+
+def claim_next():
+    """Lock and mark as running the next due job, or return None.
+
+    Jobs whose lease (locked_at, refreshed by heartbeat()) is older than
+    JOBS_LEASE_SECONDS belong to a crashed worker and are picked up again.
+    """
+    now = datetime.utcnow()
+    lease_expired = now - timedelta(seconds=_config('JOBS_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    job = Job.query.filter(
+        db.or_(
+            db.and_(Job.status == 'queued', Job.run_at <= now),
+            db.and_(Job.status == 'running', Job.locked_at < lease_expired),
+        )
+    ).order_by(Job.run_at, Job.id).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    _claim(job)
+    return job
+
+
+def run_job(job):
+    """Execute a claimed job and record the outcome (done / retry / failed)."""
+    handler = _handlers.get(job.kind)
+    previous, _local.job = _current(), job
+    try:
+        if handler is None:
+            raise KeyError(f'Unknown job kind: {job.kind}')
+        result = handler(**json.loads(job.payload or '{}'))
+    except Exception:
+        db.session.rollback()
+        job.last_error = traceback.format_exc()[-2000:]
+        if job.attempts < job.max_attempts:
+            backoff = _config('JOBS_BACKOFF_SECONDS', DEFAULT_BACKOFF_SECONDS) * (2 ** (job.attempts - 1))
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=backoff)
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            _reschedule(job)
+        db.session.commit()
+        return False
+    finally:
+        _local.job = previous
+
+    job.status = 'done'
+    job.result = json.dumps(result) if result is not None else None
+    job.last_error = None
+    job.finished_at = datetime.utcnow()
+    _reschedule(job)
+    db.session.commit()
+    return True
+
+
+def work(burst=False):
+    """Worker loop for the current app context. With burst=True exit when idle."""
+    poll = _config('JOBS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    while True:
+        job = claim_next()
+        if job is None:
+            if burst:
+                return
+            time.sleep(poll)
+            continue
+        run_job(job)
+
+
+def _worker_main(burst):
+    # import here: with the 'spawn' start method the child process has to build the app itself
+    from app import app
+    with app.app_context():
+        # never reuse connections inherited from the parent process
+        db.engine.dispose()
+        work(burst=burst)
+
+
+def start_workers(processes=1, burst=False):
+    """Run `processes` worker processes and wait for them."""
+    schedule_periodic()
+    if processes <= 1:
+        _worker_main(burst)
+        return
+    procs = [multiprocessing.Process(target=_worker_main, args=(burst,)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat() if job.run_at else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'result': json.loads(job.result) if job.result else None,
+        'progress': json.loads(job.progress) if job.progress else None,
+        'error': job.last_error.strip().splitlines()[-1] if job.last_error else None,
+    }
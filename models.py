@@ -15,10 +15,49 @@ class Tab(db.Model):
     difficulty = db.Column(db.Integer, default=3, nullable=False)
     # song speed in beats per minute (BPM) - optional
     speed_bpm = db.Column(db.Integer, default=120, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    # computed by analysis.py on create/edit (and `flask analyze-tabs`)
+    note_count = db.Column(db.Integer, nullable=True)
+    fret_min = db.Column(db.Integer, nullable=True)
+    fret_max = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     user = db.relationship('User', backref=db.backref('tabs', lazy=True))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # MinHash signature of content (hex, space separated) - see dedup.py
+    minhash = db.Column(db.Text, nullable=True)
+    # soft delete: set immediately, the row is purged later by a background job (purge.py)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def visible(cls):
+        """Query of tabs that are not soft-deleted"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+
+
+# LSH bucket index for near-duplicate lookup: one row per (tab, band)
+class TabLSHBucket(db.Model):
+    __tablename__ = 'tab_lsh_buckets'
+
+    tab_id = db.Column(db.Integer, db.ForeignKey('tabs.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (db.Index('ix_tab_lsh_buckets_band_bucket', 'band', 'bucket'),)
+
+
+# Materialized favorite counters for /trending (see trending.py)
+class TabPopularity(db.Model):
+    __tablename__ = 'tab_popularity'
+
+    tab_id = db.Column(db.Integer, db.ForeignKey('tabs.id', ondelete='CASCADE'), primary_key=True)
+    week_count = db.Column(db.Integer, default=0, nullable=False)
+    total_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_tab_popularity_week', 'week_count', 'tab_id'),
+        db.Index('ix_tab_popularity_total', 'total_count', 'tab_id'),
+    )
 
 
 # Association table for user favorites (many-to-many)
@@ -50,6 +89,10 @@ class User(db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     avatar_filename = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bumped on username / avatar changes - part of the song card cache key (cards.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # soft delete, see Tab.deleted_at
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     # relationship to the tabs that this user favorited
     favorites = db.relationship('Tab', secondary=favorites_table, backref=db.backref('favorited_by', lazy='dynamic'), lazy='dynamic')
@@ -66,8 +109,36 @@ class User(db.Model):
         lazy='dynamic'
     )
 
+    @classmethod
+    def visible(cls):
+        """Query of accounts that are not soft-deleted"""
+        return cls.query.filter(cls.deleted_at.is_(None))
+
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
+
+
+# Background jobs (see jobs.py): status is queued / running / done / failed
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=True)  # JSON kwargs for the handler
+    status = db.Column(db.String(20), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Text, nullable=True)  # JSON, see jobs.report_progress()
+    last_error = db.Column(db.Text, nullable=True)
+    # user who triggered the job (optional, no FK: jobs outlive deleted accounts)
+    user_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
@@ -0,0 +1,106 @@
+"""Soft deletion and chunked background purge of tabs and accounts.
+
+Routes only stamp deleted_at (rows disappear from every list query right
+away) and enqueue a purge job. The job removes dependent rows - favorites,
+follower edges, LSH buckets, popularity counters - and finally the tabs and
+the user in batches of PURGE_BATCH_SIZE, committing after every batch so no
+transaction holds many locks. Each step is idempotent, so a retried job just
+continues where the previous attempt stopped.
+"""
+from datetime import datetime
+
+from db import db
+from models import Tab, User, TabLSHBucket, TabPopularity, favorites_table, followers_table
+import jobs
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def soft_delete_tab(tab_id):
+    """Hide a tab immediately (single-row UPDATE, content is never loaded)."""
+    db.session.execute(
+        db.update(Tab).where(Tab.id == tab_id, Tab.deleted_at.is_(None)).values(deleted_at=datetime.utcnow())
+    )
+
+
+def soft_delete_user(user):
+    """Hide an account and all of its tabs; the heavy cleanup is left to purge_user()."""
+    now = datetime.utcnow()
+    user.deleted_at = now
+    db.session.execute(
+        db.update(Tab).where(Tab.user_id == user.id, Tab.deleted_at.is_(None)).values(deleted_at=now)
+    )
+
+
+def _delete_in_batches(table, condition, key_columns, batch_size):
+    """DELETE rows matching condition, at most batch_size per transaction. Returns rows deleted."""
+    total = 0
+    while True:
+        batch = db.select(*key_columns).where(condition).limit(batch_size)
+        result = db.session.execute(db.delete(table).where(db.tuple_(*key_columns).in_(batch)))
+        jobs.heartbeat()
+        db.session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def _purge_tab_ids(tab_ids, batch_size):
+    """Remove dependents of the given tabs, then the tabs themselves. Returns favorites removed."""
+    fav = favorites_table.c
+    favorites = _delete_in_batches(favorites_table, fav.tab_id.in_(tab_ids), (fav.user_id, fav.tab_id), batch_size)
+    db.session.execute(db.delete(TabLSHBucket).where(TabLSHBucket.tab_id.in_(tab_ids)))
+    db.session.execute(db.delete(TabPopularity).where(TabPopularity.tab_id.in_(tab_ids)))
+    db.session.execute(db.delete(Tab).where(Tab.id.in_(tab_ids)))
+    jobs.heartbeat()
+    db.session.commit()
+    return favorites
+
+
+def purge_tab(tab_id, batch_size=DEFAULT_BATCH_SIZE):
+    """Physically delete a soft-deleted tab."""
+    exists = db.session.query(Tab.id).filter(Tab.id == tab_id, Tab.deleted_at.isnot(None)).first()
+    if exists is None:
+        return {'deleted': False}
+    favorites = _purge_tab_ids([tab_id], batch_size)
+    return {'deleted': True, 'favorites': favorites}
+
+
+def purge_user(user_id, batch_size=DEFAULT_BATCH_SIZE):
+    """Physically delete a soft-deleted account step by step, reporting progress."""
+    exists = db.session.query(User.id).filter(User.id == user_id, User.deleted_at.isnot(None)).first()
+    if exists is None:
+        return {'deleted': False}
+
+    progress = {'step': 'tabs', 'tabs': 0, 'favorites': 0, 'followers': 0}
+    jobs.report_progress(progress)
+
+    # 1. the user's tabs, batch by batch
+    while True:
+        tab_ids = [row[0] for row in db.session.query(Tab.id).filter(Tab.user_id == user_id).limit(batch_size)]
+        if not tab_ids:
+            break
+        progress['favorites'] += _purge_tab_ids(tab_ids, batch_size)
+        progress['tabs'] += len(tab_ids)
+        jobs.report_progress(progress)
+
+    # 2. favorites made by the user
+    progress['step'] = 'favorites'
+    fav = favorites_table.c
+    progress['favorites'] += _delete_in_batches(
+        favorites_table, fav.user_id == user_id, (fav.user_id, fav.tab_id), batch_size)
+    jobs.report_progress(progress)
+
+    # 3. follower edges in both directions
+    progress['step'] = 'followers'
+    fol = followers_table.c
+    progress['followers'] += _delete_in_batches(
+        followers_table, db.or_(fol.follower_id == user_id, fol.followed_id == user_id),
+        (fol.follower_id, fol.followed_id), batch_size)
+    jobs.report_progress(progress)
+
+    # 4. the account row itself
+    db.session.execute(db.delete(User).where(User.id == user_id))
+    db.session.commit()
+    progress['step'] = 'done'
+    return dict(progress, deleted=True)
@@ -0,0 +1,306 @@
+"""In-process prefix index for search-as-you-type (/api/suggest).
+
+Titles, artists and usernames are normalized and stored as sorted
+(key, kind, ref) tuples; a lookup is a bisect to the first key with the
+prefix plus a bounded forward scan, ranked by popularity. Every word start
+of a name is indexed, so "pupp" finds "Master of Puppets".
+
+The index is per process: routes update it incrementally on create / edit /
+delete, and a daemon thread rebuilds it from the database every
+REBUILD_SECONDS so that other workers' changes and popularity shifts show up
+too. A rebuild fills a new SuggestIndex and swaps it in; the old one keeps
+serving lookups meanwhile, and updates made during the build are replayed
+onto the new one. It never holds more than max_keys keys - the least popular
+entries are evicted first.
+"""
+import bisect
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from db import db
+from models import Tab, User, TabPopularity, followers_table
+
+MAX_KEYS = 200000
+MAX_WORDS = 6
+SCAN_LIMIT = 2000
+REBUILD_SECONDS = 600
+
+_NON_WORD = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase, strip accents, ё -> е, punctuation -> single spaces."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text.lower().replace('ё', 'е'))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _keys_for(text):
+    """Full normalized name plus the suffixes starting at each of the first words."""
+    norm = normalize(text)
+    if not norm:
+        return []
+    words = norm.split(' ')
+    keys = []
+    for i in range(min(len(words), MAX_WORDS)):
+        keys.append(' '.join(words[i:]))
+    return keys
+
+
+class SuggestIndex:
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = []       # sorted (key, kind, ref)
+        self._entries = {}    # (kind, ref) -> {'label', 'score', 'seq', 'keys', ...}
+        self._artists = {}    # normalized artist -> {'label', 'tabs': {tab_id: score}}
+        self._heap = []       # (score, seq, kind, ref), lazily invalidated: eviction order
+        self._seq = itertools.count()
+        self._bulk = False    # load: append keys and sort once at the end
+        self._journal = None  # updates recorded while a replacement is being built
+        self._successor = None
+        self.built_at = 0.0
+
+    # ---------- low level ----------
+    def _put(self, kind, ref, label, score, extra=None):
+        if not self._bulk:
+            self._drop(kind, ref)
+        keys = _keys_for(label)
+        seq = next(self._seq)
+        entry = {'label': label, 'score': score, 'seq': seq, 'keys': keys}
+        if extra:
+            entry.update(extra)
+        self._entries[(kind, ref)] = entry
+        if self._bulk:
+            self._heap.append((score, seq, kind, ref))
+            self._keys.extend((key, kind, ref) for key in keys)
+            return
+        heapq.heappush(self._heap, (score, seq, kind, ref))
+        for key in keys:
+            bisect.insort(self._keys, (key, kind, ref))
+        self._evict()
+
+    def _drop(self, kind, ref):
+        entry = self._entries.pop((kind, ref), None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            i = bisect.bisect_left(self._keys, (key, kind, ref))
+            if i < len(self._keys) and self._keys[i] == (key, kind, ref):
+                del self._keys[i]
+
+    def _evict(self):
+        # over budget: drop the least popular entries (oldest first among equal scores)
+        while len(self._keys) > self.max_keys and self._heap:
+            score, seq, kind, ref = heapq.heappop(self._heap)
+            entry = self._entries.get((kind, ref))
+            if entry is None or entry['seq'] != seq:
+                continue  # replaced or removed since it was pushed
+            if kind == 'tab':
+                self._remove_tab(ref)
+            else:
+                # an evicted artist comes back when one of their tabs changes
+                self._drop(kind, ref)
+
+    def _put_artist(self, norm):
+        # artist popularity: favorites of all their tabs plus one per tab
+        info = self._artists[norm]
+        self._put('artist', norm, info['label'], sum(info['tabs'].values()) + len(info['tabs']))
+
+    def _add_artist_tab(self, artist, tab_id, score):
+        norm = normalize(artist)
+        if not norm:
+            return
+        info = self._artists.setdefault(norm, {'label': artist, 'tabs': {}})
+        info['tabs'][tab_id] = score
+        if not self._bulk:
+            self._put_artist(norm)
+
+    def _remove_artist_tab(self, artist, tab_id):
+        norm = normalize(artist)
+        info = self._artists.get(norm)
+        if info is None or tab_id not in info['tabs']:
+            return
+        del info['tabs'][tab_id]
+        if info['tabs']:
+            self._put_artist(norm)
+        else:
+            del self._artists[norm]
+            self._drop('artist', norm)
+
+    def _score(self, kind, ref, score):
+        # score=None: keep the popularity already known for this entry
+        if score is not None:
+            return score
+        entry = self._entries.get((kind, ref))
+        return entry['score'] if entry else 0
+
+    # ---------- incremental updates ----------
+    def _apply(self, name, *args):
+        """Run an update under the lock; once replaced by a rebuilt index, forward it there."""
+        with self._lock:
+            successor = self._successor
+            if successor is None:
+                if self._journal is not None:
+                    self._journal.append((name, args))
+                getattr(self, name)(*args)
+                return
+        successor._apply(name, *args)
+
+    def _add_tab(self, tab_id, title, artist, score):
+        score = self._score('tab', tab_id, score)
+        self._remove_tab(tab_id)
+        self._put('tab', tab_id, title, score, {'artist': artist})
+        self._add_artist_tab(artist, tab_id, score)
+
+    def _remove_tab(self, tab_id):
+        entry = self._entries.get(('tab', tab_id))
+        if entry is None:
+            return
+        self._drop('tab', tab_id)
+        self._remove_artist_tab(entry['artist'], tab_id)
+
+    def _add_user(self, user_id, username, score):
+        self._put('user', user_id, username, self._score('user', user_id, score))
+
+    def add_tab(self, tab_id, title, artist, score=None):
+        self._apply('_add_tab', tab_id, title, artist, score)
+
+    def remove_tab(self, tab_id):
+        self._apply('_remove_tab', tab_id)
+
+    def add_user(self, user_id, username, score=None):
+        self._apply('_add_user', user_id, username, score)
+
+    def remove_user(self, user_id):
+        self._apply('_drop', 'user', user_id)
+
+    # ---------- bulk ----------
+    def load(self):
+        """Fill a new, unused index from the database, keeping the most popular entries within max_keys."""
+        tab_rows = db.session.query(Tab.id, Tab.title, Tab.artist, TabPopularity.total_count) \
+            .outerjoin(TabPopularity, TabPopularity.tab_id == Tab.id) \
+            .filter(Tab.deleted_at.is_(None)).all()
+        follower_counts = db.select(
+            followers_table.c.followed_id.label('user_id'), db.func.count().label('n')
+        ).group_by(followers_table.c.followed_id).subquery()
+        user_rows = db.session.query(User.id, User.username, follower_counts.c.n) \
+            .outerjoin(follower_counts, follower_counts.c.user_id == User.id) \
+            .filter(User.deleted_at.is_(None)).all()
+        db.session.commit()
+
+        candidates = [('tab', r.id, r.title, r.total_count or 0, r.artist) for r in tab_rows]
+        candidates += [('user', r.id, r.username, r.n or 0, None) for r in user_rows]
+        candidates.sort(key=lambda c: c[3], reverse=True)
+
+        with self._lock:
+            self._bulk = True
+            budget = self.max_keys
+            for kind, ref, label, score, artist in candidates:
+                budget -= len(_keys_for(label)) + (len(_keys_for(artist)) if artist else 0)
+                if budget < 0:
+                    break
+                if kind == 'tab':
+                    self._put('tab', ref, label, score, {'artist': artist})
+                    self._add_artist_tab(artist, ref, score)
+                else:
+                    self._put('user', ref, label, score)
+            for norm in self._artists:
+                self._put_artist(norm)
+            self._keys.sort()
+            heapq.heapify(self._heap)
+            self._bulk = False
+            self._evict()
+            self.built_at = time.time()
+
+    def _start_journal(self):
+        with self._lock:
+            self._journal = []
+
+    def _hand_over(self, successor):
+        """Replay updates made during the rebuild onto `successor` and forward all later ones."""
+        with self._lock:
+            for name, args in self._journal or ():
+                successor._apply(name, *args)
+            self._journal = None
+            self._successor = successor
+
+    # ---------- lookup ----------
+    def suggest(self, query, limit=8):
+        """Best `limit` entries whose indexed key starts with the normalized query."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            seen = {}
+            end = min(len(self._keys), i + SCAN_LIMIT)
+            while i < end and self._keys[i][0].startswith(prefix):
+                _, kind, ref = self._keys[i]
+                if (kind, ref) not in seen:
+                    seen[(kind, ref)] = self._entries[(kind, ref)]
+                i += 1
+            ranked = sorted(seen.items(), key=lambda item: (-item[1]['score'], item[1]['label']))[:limit]
+            return [
+                {'type': kind, 'ref': ref, 'label': entry['label'], 'artist': entry.get('artist')}
+                for (kind, ref), entry in ranked
+            ]
+
+
+index = SuggestIndex()
+
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def rebuild():
+    """Build a fresh index from the database and swap it in. Needs an app context."""
+    global index
+    current = index
+    current._start_journal()
+    fresh = SuggestIndex(max_keys=current.max_keys)
+    try:
+        fresh.load()
+    except Exception:
+        with current._lock:
+            current._journal = None
+        raise
+    current._hand_over(fresh)
+    index = fresh
+    return fresh
+
+
+def _refresh_forever(app, interval):
+    while True:
+        try:
+            with app.app_context():
+                rebuild()
+        except Exception:
+            app.logger.exception('suggest index rebuild failed')
+        time.sleep(interval)
+
+
+def start_refresher(app, interval=REBUILD_SECONDS):
+    """Start the background rebuild thread of this process (no-op if already running).
+
+    The first build starts immediately; until it finishes lookups are served
+    from the incremental updates only.
+    """
+    global _refresher_pid
+    pid = os.getpid()
+    if _refresher_pid == pid:
+        return
+    with _refresher_lock:
+        if _refresher_pid != pid:
+            threading.Thread(
+                target=_refresh_forever, args=(app, interval), name='suggest-rebuild', daemon=True
+            ).start()
+            _refresher_pid = pid
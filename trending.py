@@ -0,0 +1,146 @@
+"""Materialized popularity rankings built from favorites activity.
+
+tab_popularity keeps per-tab favorite counters: all-time and within the
+rolling WINDOW_DAYS window. toggle_favorite() adjusts them in the same
+transaction, and the periodic `refresh_trending` job recounts everything so
+favorites that age out of the window (or vanish with deleted accounts) are
+dropped. Reading the top K is an index scan of K rows, never a GROUP BY.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from db import db
+from models import Tab, TabPopularity, favorites_table
+
+WINDOW_DAYS = 7
+REFRESH_SECONDS = 15 * 60
+MAX_LIMIT = 100
+REFRESH_BATCH_SIZE = 1000
+
+PERIOD_COLUMNS = {
+    'week': TabPopularity.week_count,
+    'all': TabPopularity.total_count,
+}
+
+
+def _window_start():
+    return datetime.utcnow() - timedelta(days=WINDOW_DAYS)
+
+
+def favorited_at(user_id, tab_id):
+    """created_at of an existing favorite row (None if missing)."""
+    return db.session.execute(
+        db.select(favorites_table.c.created_at).where(
+            favorites_table.c.user_id == user_id,
+            favorites_table.c.tab_id == tab_id,
+        )
+    ).scalar()
+
+
+def record_favorite(tab_id, added, created_at=None):
+    """Adjust counters for one favorite being added or removed (caller commits).
+
+    For a removal pass the favorite's created_at so the weekly counter is only
+    decremented if that favorite was still inside the window.
+    """
+    now = datetime.utcnow()
+    if added:
+        week_delta, total_delta = 1, 1
+    else:
+        in_window = created_at is None or created_at >= _window_start()
+        week_delta, total_delta = (-1 if in_window else 0), -1
+
+    stmt = pg_insert(TabPopularity).values(
+        tab_id=tab_id,
+        week_count=max(week_delta, 0),
+        total_count=max(total_delta, 0),
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TabPopularity.tab_id],
+        set_={
+            'week_count': db.func.greatest(TabPopularity.week_count + week_delta, 0),
+            'total_count': db.func.greatest(TabPopularity.total_count + total_delta, 0),
+            'updated_at': now,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def refresh(batch_size=REFRESH_BATCH_SIZE):
+    """Recount all counters from the favorites table and correct the ones that drifted.
+
+    One statement reads the GROUP BY counts together with the stored counters
+    (a single snapshot) and returns only the rows that differ. The corrections
+    are applied as deltas, batch_size rows per transaction, so favorites toggled
+    while the refresh runs are kept and toggle_favorite() is never blocked
+    behind a lock on every counter. Returns the number of rows corrected.
+    """
+    in_window = db.case((favorites_table.c.created_at >= _window_start(), 1), else_=0)
+    counts = db.select(
+        favorites_table.c.tab_id,
+        db.func.sum(in_window).label('week'),
+        db.func.count().label('total'),
+    ).group_by(favorites_table.c.tab_id).subquery()
+    week = db.func.coalesce(counts.c.week, 0)
+    total = db.func.coalesce(counts.c.total, 0)
+    old_week = db.func.coalesce(TabPopularity.week_count, 0)
+    old_total = db.func.coalesce(TabPopularity.total_count, 0)
+    changes = db.session.execute(
+        db.select(
+            db.func.coalesce(counts.c.tab_id, TabPopularity.tab_id),
+            TabPopularity.tab_id.isnot(None),
+            week - old_week,
+            total - old_total,
+        ).select_from(
+            counts.outerjoin(TabPopularity, TabPopularity.tab_id == counts.c.tab_id, full=True)
+        ).where(db.or_(week != old_week, total != old_total))
+    ).all()
+    db.session.commit()
+
+    table = TabPopularity.__table__
+    adjust = db.update(table).where(table.c.tab_id == db.bindparam('b_tab_id')).values(
+        week_count=db.func.greatest(table.c.week_count + db.bindparam('b_week'), 0),
+        total_count=db.func.greatest(table.c.total_count + db.bindparam('b_total'), 0),
+        updated_at=db.bindparam('b_now'),
+    )
+    for i in range(0, len(changes), batch_size):
+        now = datetime.utcnow()
+        batch = changes[i:i + batch_size]
+        existing = [
+            {'b_tab_id': tab_id, 'b_week': int(dw), 'b_total': int(dt), 'b_now': now}
+            for tab_id, stored, dw, dt in batch if stored
+        ]
+        if existing:
+            db.session.execute(adjust, existing)
+        missing = [
+            {'tab_id': tab_id, 'week_count': int(dw), 'total_count': int(dt), 'updated_at': now}
+            for tab_id, stored, dw, dt in batch if not stored
+        ]
+        if missing:
+            # counters for these tabs did not exist at read time; one may have been created since
+            stmt = pg_insert(TabPopularity).values(missing)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[TabPopularity.tab_id],
+                set_={
+                    'week_count': TabPopularity.week_count + stmt.excluded.week_count,
+                    'total_count': TabPopularity.total_count + stmt.excluded.total_count,
+                    'updated_at': stmt.excluded.updated_at,
+                },
+            )
+            db.session.execute(stmt)
+        db.session.commit()
+    return len(changes)
+
+
+def top(period='week', limit=20):
+    """Top `limit` tabs for the period ('week' or 'all') as a list of (tab, count)."""
+    column = PERIOD_COLUMNS.get(period, TabPopularity.week_count)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    return db.session.query(Tab, column) \
+        .options(db.defer(Tab.content), db.joinedload(Tab.user)) \
+        .join(TabPopularity, TabPopularity.tab_id == Tab.id) \
+        .filter(column > 0, Tab.deleted_at.is_(None)) \
+        .order_by(column.desc(), TabPopularity.tab_id.desc()) \
+        .limit(limit).all()